@@ -0,0 +1,320 @@
+"""
+Offline load test for rpc-server and screen-interpreter.
+
+Starts local stand-ins for QuickNode, TxSentinel and the OpenAI Responses API,
+launches both services against them and reports throughput and p50/p99 per
+endpoint. Run from an environment with both services' requirements installed:
+
+    python bench/bench.py --scenarios reads,sends,screens
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from collections import defaultdict
+from pathlib import Path
+
+import aiohttp
+
+import mocks
+
+ROOT = Path(__file__).resolve().parent.parent
+
+RPC_PORT = 8089
+SCREEN_PORT = 5001
+
+READ_MIX = [
+    ("eth_blockNumber", lambda: [], 50),
+    ("eth_getTransactionReceipt", lambda: ["0x" + os.urandom(32).hex()], 30),
+    ("eth_getBalance", lambda: ["0x" + os.urandom(20).hex(), "latest"], 10),
+    ("eth_chainId", lambda: [], 10),
+]
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.window: dict[str, tuple[float, float]] = {}
+
+    def record(self, endpoint: str, start: float, end: float, ok: bool):
+        self.samples[endpoint].append(end - start)
+        if not ok:
+            self.errors[endpoint] += 1
+        first, last = self.window.get(endpoint, (start, end))
+        self.window[endpoint] = (min(first, start), max(last, end))
+
+    def report(self) -> list[dict]:
+        rows = []
+        for endpoint, samples in self.samples.items():
+            first, last = self.window[endpoint]
+            samples = sorted(samples)
+            rows.append({
+                "endpoint": endpoint,
+                "requests": len(samples),
+                "errors": self.errors[endpoint],
+                "throughput_rps": len(samples) / (last - first) if last > first else 0.0,
+                "p50_ms": percentile(samples, 50) * 1000,
+                "p99_ms": percentile(samples, 99) * 1000,
+            })
+        return rows
+
+def percentile(sorted_samples: list[float], p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[max(0, math.ceil(p / 100 * len(sorted_samples)) - 1)]
+
+async def timed_post(session: aiohttp.ClientSession, rec: Recorder, endpoint: str, url: str, payload) -> bytes | None:
+    start = time.perf_counter()
+    body = None
+    try:
+        async with session.post(url, json=payload) as resp:
+            body = await resp.read()
+            ok = resp.status < 300 and b'"error"' not in body
+    except aiohttp.ClientError:
+        ok = False
+    rec.record(endpoint, start, time.perf_counter(), ok)
+    return body
+
+def wait_for_port(port: int, timeout: float) -> float:
+    """Blocks until something accepts connections on port and returns the seconds waited."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+async def wait_for_http(method: str, url: str, timeout: float, **kwargs) -> float:
+    """
+    Polls url until it answers 200 and returns the seconds waited. A bound port
+    is not enough: uvicorn's supervisor (with several workers) and Werkzeug's
+    reloader parent both bind it before the process serving requests is up.
+    """
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1)) as session:
+        while time.perf_counter() - start < timeout:
+            try:
+                async with session.request(method, url, **kwargs) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            await asyncio.sleep(0.02)
+    raise TimeoutError(f"Nothing answering {method} {url} after {timeout}s")
+
+def import_time(module: str, path: Path, cwd: Path | str, env: dict, top: int = 5) -> dict:
+    """Imports module in a fresh interpreter with -X importtime and returns its total and slowest direct imports."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env={**os.environ, **env, "PYTHONPATH": str(path)}, capture_output=True, text=True,
+    )
+    children = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0:
+            if name == module:
+                children.sort(key=lambda child: child[1], reverse=True)
+                return {"total_ms": int(cumulative) / 1000, "top": children[:top]}
+            children = []
+        elif depth == 1:
+            children.append((name.strip(), int(cumulative) / 1000))
+    raise RuntimeError(f"Could not import {module}: {proc.stderr[-500:]}")
+
+def launch(cmd: list[str], cwd: Path | str, env: dict) -> subprocess.Popen:
+    # own session so the whole tree (uvicorn workers, flask reloader) can be stopped at once
+    return subprocess.Popen(cmd, cwd=cwd, env={**os.environ, **env}, start_new_session=True)
+
+def stop(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=10)
+    except ProcessLookupError:
+        pass
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+def noise_png(width: int, height: int) -> str:
+    """Random RGB frame encoded as a PNG data URL, so consecutive frames always differ."""
+    raw = b"".join(b"\x00" + os.urandom(width * 3) for _ in range(height))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    png = (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
+    return "data:image/png;base64," + base64.b64encode(png).decode()
+
+def sign_transactions(count: int) -> list[str]:
+    from eth_account import Account
+
+    account = Account.create()
+    return [
+        Account.sign_transaction({
+            "type": 2,
+            "chainId": int(mocks.CHAIN_ID, 16),
+            "nonce": nonce,
+            "to": Account.create().address,
+            "value": 10**15,
+            "gas": 21000,
+            "maxFeePerGas": 10**9,
+            "maxPriorityFeePerGas": 10**8,
+        }, account.key).raw_transaction.to_0x_hex()
+        for nonce in range(count)
+    ]
+
+async def run_reads(session: aiohttp.ClientSession, rec: Recorder, args):
+    url = f"http://127.0.0.1:{RPC_PORT}/"
+    jobs = iter(range(args.reads))
+    methods, weights = zip(*((m, w) for m, _, w in READ_MIX))
+    params = {m: p for m, p, _ in READ_MIX}
+
+    async def worker():
+        for i in jobs:
+            method = random.choices(methods, weights)[0]
+            payload = {"jsonrpc": "2.0", "id": i, "method": method, "params": params[method]()}
+            await timed_post(session, rec, f"rpc {method}", url, payload)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+async def run_sends(session: aiohttp.ClientSession, rec: Recorder, args):
+    url = f"http://127.0.0.1:{RPC_PORT}/"
+    raw_txs = sign_transactions(args.bursts * args.burst_size)
+    for burst in range(args.bursts):
+        # intents are keyed by client and minute, refresh before every burst
+        await timed_post(session, rec, "rpc /intents", f"{url}intents", {"intent": "Swap 0.001 ETH on a DEX"})
+        batch = raw_txs[burst * args.burst_size:(burst + 1) * args.burst_size]
+        await asyncio.gather(*(
+            timed_post(session, rec, "rpc eth_sendRawTransaction", url,
+                       {"jsonrpc": "2.0", "id": i, "method": "eth_sendRawTransaction", "params": [raw_tx]})
+            for i, raw_tx in enumerate(batch)
+        ))
+        await asyncio.sleep(args.burst_interval)
+
+async def run_screens(session: aiohttp.ClientSession, rec: Recorder, args):
+    url = f"http://127.0.0.1:{SCREEN_PORT}"
+    width, height = (int(v) for v in args.frame_size.split("x"))
+    frames = [noise_png(width, height) for _ in range(min(args.frames, 8))]
+    for _ in range(args.screen_sessions):
+        for i in range(args.frames):
+            await timed_post(session, rec, "screen /save-image", f"{url}/save-image", {"image": frames[i % len(frames)]})
+            if args.frame_interval:
+                await asyncio.sleep(args.frame_interval)
+        await timed_post(session, rec, "screen /stop-recording", f"{url}/stop-recording", {})
+
+SCENARIOS = {"reads": run_reads, "sends": run_sends, "screens": run_screens}
+
+def print_report(rows: list[dict], startup: dict[str, float], imports: dict[str, dict]):
+    for service, report in imports.items():
+        slowest = ", ".join(f"{name} {ms:.0f}" for name, ms in report["top"])
+        print(f"{service} import {report['total_ms']:.0f} ms ({slowest})")
+    for service, seconds in startup.items():
+        print(f"{service} ready after {seconds * 1000:.0f} ms")
+    print()
+    print(f"{'endpoint':<34}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        print(f"{row['endpoint']:<34}{row['requests']:>9}{row['errors']:>8}"
+              f"{row['throughput_rps']:>10.1f}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+async def main(args):
+    scenarios = args.scenarios.split(",")
+    mock_procs = []
+    for name in mocks.APPS:
+        faults = mocks.Faults(*(getattr(args, f"{name}_{field}") for field in ("latency", "jitter", "error_rate")))
+        proc = multiprocessing.Process(target=mocks.serve, args=(name, getattr(args, f"{name}_port"), faults), daemon=True)
+        proc.start()
+        mock_procs.append(proc)
+    procs = []
+    startup = {}
+    workdir = tempfile.TemporaryDirectory(prefix="flowsentinel-bench-")
+    rpc_env = {
+        "QUICKNODE_URL": f"http://127.0.0.1:{args.node_port}/",
+        "QUICKNODE_API_KEY": "bench",
+        "API_URL": f"http://127.0.0.1:{args.sentinel_port}/api/transaction",
+        "LOGGING_LEVEL": "WARNING",
+        "WORKERS": str(args.workers),
+    }
+    screen_env = {
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "RPC_SERVER_API": f"http://127.0.0.1:{RPC_PORT}/intents",
+    }
+    try:
+        imports = {"rpc-server": import_time("main", ROOT / "rpc-server", workdir.name, rpc_env)}
+        if "screens" in scenarios:
+            imports["screen-interpreter"] = import_time("server", ROOT / "screen-interpreter", workdir.name, screen_env)
+
+        for name in mocks.APPS:
+            await asyncio.to_thread(wait_for_port, getattr(args, f"{name}_port"), args.startup_timeout)
+        procs.append(launch([sys.executable, "run.py"], ROOT / "rpc-server", rpc_env))
+        chain_id = {"jsonrpc": "2.0", "id": 0, "method": "eth_chainId", "params": []}
+        startup["rpc-server"] = await wait_for_http("POST", f"http://127.0.0.1:{RPC_PORT}/", args.startup_timeout, json=chain_id)
+        if "screens" in scenarios:
+            # screen-interpreter writes images and analyses to its cwd
+            procs.append(launch([sys.executable, str(ROOT / "screen-interpreter" / "server.py")], workdir.name, screen_env))
+            # the CORS preflight answers 200 without touching the session or disk
+            startup["screen-interpreter"] = await wait_for_http("OPTIONS", f"http://127.0.0.1:{SCREEN_PORT}/save-image", args.startup_timeout)
+
+        rec = Recorder()
+        connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for name in scenarios:
+                await SCENARIOS[name](session, rec, args)
+
+        rows = rec.report()
+        print_report(rows, startup, imports)
+        if args.json:
+            Path(args.json).write_text(json.dumps({"imports": imports, "startup_s": startup, "endpoints": rows}, indent=2))
+    finally:
+        for proc in procs:
+            stop(proc)
+        for proc in mock_procs:
+            proc.terminate()
+        workdir.cleanup()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="reads,sends,screens", help="comma separated: reads, sends, screens")
+    parser.add_argument("--workers", type=int, default=1, help="rpc-server uvicorn workers")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients for reads")
+    parser.add_argument("--reads", type=int, default=5000, help="total read requests")
+    parser.add_argument("--bursts", type=int, default=5, help="number of raw send bursts")
+    parser.add_argument("--burst-size", type=int, default=20, help="raw sends per burst")
+    parser.add_argument("--burst-interval", type=float, default=0.5, help="seconds between bursts")
+    parser.add_argument("--screen-sessions", type=int, default=3, help="recordings to stream and stop")
+    parser.add_argument("--frames", type=int, default=10, help="screenshots per recording")
+    parser.add_argument("--frame-size", default="640x360", help="screenshot WIDTHxHEIGHT")
+    parser.add_argument("--frame-interval", type=float, default=0.0, help="seconds between screenshots")
+    parser.add_argument("--startup-timeout", type=float, default=30.0)
+    parser.add_argument("--json", help="also write the report to this file")
+    for mock, port, latency in (("node", 18545, 0.02), ("sentinel", 18000, 0.2), ("openai", 18080, 0.5)):
+        parser.add_argument(f"--{mock}-port", type=int, default=port)
+        parser.add_argument(f"--{mock}-latency", type=float, default=latency, help="seconds added to every response")
+        parser.add_argument(f"--{mock}-jitter", type=float, default=latency / 2, help="extra uniform random delay")
+        parser.add_argument(f"--{mock}-error-rate", type=float, default=0.0, help="fraction of failed responses")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
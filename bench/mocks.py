@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import random
+import time
+
+from dataclasses import dataclass
+
+from aiohttp import web
+
+CHAIN_ID = "0x2105"  # Base mainnet
+
+@dataclass
+class Faults:
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+    async def inject(self) -> bool:
+        """Sleeps for the configured latency and returns True if this call should fail."""
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return random.random() < self.error_rate
+
+def node_result(method: str, params: list):
+    if method == "eth_chainId":
+        return CHAIN_ID
+    if method == "eth_blockNumber":
+        return hex(int(time.time() // 2))
+    if method in ("eth_sendRawTransaction", "qn_broadcastRawTransaction"):
+        return "0x" + hashlib.sha256(params[0].encode()).hexdigest()
+    if method == "eth_getTransactionReceipt":
+        return {
+            "transactionHash": params[0],
+            "blockNumber": hex(int(time.time() // 2)),
+            "status": "0x1",
+            "gasUsed": "0x5208",
+            "logs": [],
+        }
+    if method == "eth_getBalance":
+        return hex(10**18)
+    return "0x"
+
+def node_app(faults: Faults) -> web.Application:
+    """JSON-RPC stand-in for the QuickNode endpoint."""
+    async def handle(request: web.Request) -> web.Response:
+        payload = await request.json()
+
+        async def answer(call: dict) -> dict:
+            if await faults.inject():
+                return {"jsonrpc": "2.0", "id": call.get("id"), "error": {"code": -32000, "message": "injected failure"}}
+            return {"jsonrpc": "2.0", "id": call.get("id"), "result": node_result(call["method"], call.get("params", []))}
+
+        if isinstance(payload, list):
+            return web.json_response(await asyncio.gather(*(answer(call) for call in payload)))
+        return web.json_response(await answer(payload))
+
+    app = web.Application()
+    app.router.add_post("/{key:.*}", handle)
+    return app
+
+def sentinel_app(faults: Faults) -> web.Application:
+    """Stand-in for the TxSentinel transaction evaluation API."""
+    async def handle(request: web.Request) -> web.Response:
+        await request.json()
+        if await faults.inject():
+            return web.json_response({"detail": "injected failure"}, status=500)
+        return web.json_response({
+            "validations": {
+                "agent": {
+                    "status": "approved",
+                    "message": "Transaction matches the declared intent.",
+                    "risks_detected": [],
+                }
+            }
+        })
+
+    app = web.Application(client_max_size=1024**2)
+    app.router.add_post("/api/transaction", handle)
+    return app
+
+def openai_app(faults: Faults) -> web.Application:
+    """Stand-in for the OpenAI Responses API, enough for client.responses.create()."""
+    async def handle(request: web.Request) -> web.Response:
+        payload = await request.json()
+        if await faults.inject():
+            return web.json_response({"error": {"message": "injected failure", "type": "server_error"}}, status=500)
+        return web.json_response({
+            "id": f"resp_{random.getrandbits(64):016x}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": payload.get("model", "gpt-5"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{random.getrandbits(64):016x}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{
+                    "type": "output_text",
+                    "text": "The user is on a DEX swapping 0.5 ETH for USDC.",
+                    "annotations": [],
+                }],
+            }],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+        })
+
+    # screenshots arrive base64 encoded inside the request body
+    app = web.Application(client_max_size=64 * 1024**2)
+    app.router.add_post("/v1/responses", handle)
+    return app
+
+APPS = {"node": node_app, "sentinel": sentinel_app, "openai": openai_app}
+
+def serve(name: str, port: int, faults: Faults):
+    """Process entry point, so mocks never compete with the load generator's event loop."""
+    web.run_app(APPS[name](faults), host="127.0.0.1", port=port, access_log=None, print=None)
@@ -1,6 +1,23 @@
+import asyncio
+import os
+
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from routers import rpc_router
+from routers import close_provider_session, rpc_router, subscription_hub, warm_up
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load the web3 stack in the background instead of delaying readiness
+    warm_up_task = None
+    if os.environ.get("WARMUP", "true").lower() == "true":
+        warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    if warm_up_task is not None:
+        await warm_up_task
+    await subscription_hub.close()
+    await close_provider_session()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(rpc_router)
@@ -1,18 +1,34 @@
 import aiohttp
+import asyncio
+import importlib
+import json
 import os
 import logging
+import threading
 
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Request
-from hexbytes import HexBytes
-from eth_typing import HexStr
-from eth_account import Account
-from eth_account.typed_transactions.typed_transaction import TypedTransaction
+from fastapi import APIRouter, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.requests import HTTPConnection
+from pydantic import ValidationError
 
 from models import RPC, TxInfo, IntentRequest
-from web3 import Web3
+from subscriptions import CLIENT_QUEUE_SIZE, SubscriptionHub, UpstreamError
 
-w3c = Web3(Web3.HTTPProvider(f"{os.environ['QUICKNODE_URL']}{os.environ['QUICKNODE_API_KEY']}"))
+PROVIDER_URL = f"{os.environ['QUICKNODE_URL']}{os.environ['QUICKNODE_API_KEY']}"
+
+# web3, eth_account and hexbytes dominate import time and are only needed once a
+# transaction is intercepted, so they are imported on first use (or by warm_up)
+w3c = None
+# get_w3c runs both in the warm-up thread and in request handlers
+w3c_lock = threading.Lock()
+
+# QuickNode serves websockets on the same endpoint as HTTP
+subscription_hub = SubscriptionHub(
+    os.environ.get("QUICKNODE_WS_URL")
+    or f"{os.environ['QUICKNODE_URL'].replace('http', 'ws', 1)}{os.environ['QUICKNODE_API_KEY']}"
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +42,31 @@ INTENT_TIMEOUT = 3600
 RELEASED_TX = 1
 ACCEPTED_WARNING = 2
 
+PROVIDER_TIMEOUT = 30
+
+# methods that need the full RPC model, matched on their quoted name in the raw body
+HTTP_INTERCEPTED_METHODS = (b'"eth_sendRawTransaction"',)
+WS_INTERCEPTED_METHODS = HTTP_INTERCEPTED_METHODS + (b'"eth_subscribe"', b'"eth_unsubscribe"')
+
+provider_session: aiohttp.ClientSession | None = None
+
+def get_w3c():
+    global w3c
+    with w3c_lock:
+        if w3c is None:
+            from web3 import Web3
+            w3c = Web3(Web3.HTTPProvider(PROVIDER_URL))
+    return w3c
+
+def warm_up():
+    try:
+        importlib.import_module("eth_account")
+        importlib.import_module("eth_account.typed_transactions.typed_transaction")
+        get_w3c()
+        logger.info("Warm-up finished")
+    except Exception as e:
+        logger.warning(f"Warm-up failed: {e}")
+
 def clean_intents():
     global intents
     logger.info(f"Cleaning old intents {intents}")
@@ -34,6 +75,9 @@ def clean_intents():
     logger.info(f"Finished cleaning old intents {intents}")
 
 async def release_tx(tx_hash: str) -> str:
+    from eth_typing import HexStr
+    from hexbytes import HexBytes
+
     tx_info = txs[tx_hash]
     signed_raw_tx = HexStr(tx_info.signed_raw_tx)
 
@@ -41,7 +85,7 @@ async def release_tx(tx_hash: str) -> str:
     # XXX: here we're using the qn_broadcastRawTransaction method
     # instead of the regular eth_sendRawTransaction method
     actual_hash = HexBytes(
-        w3c.provider.make_request(
+        get_w3c().provider.make_request(
             "qn_broadcastRawTransaction",
             [signed_raw_tx]
         )["result"] # type: ignore
@@ -74,6 +118,9 @@ async def perform_request(body):
                 return request_result
 
 async def process_tx(tx_hash: str, intent: str) -> tuple[int, str]:
+    from eth_account.typed_transactions.typed_transaction import TypedTransaction
+    from hexbytes import HexBytes
+
     tx_info = txs[tx_hash]
 
     tx_decoded = TypedTransaction.from_bytes(
@@ -89,7 +136,7 @@ async def process_tx(tx_hash: str, intent: str) -> tuple[int, str]:
     value = int(tx_decoded.get("value", 0))
 
     veredict = await perform_request({
-        "chainId": w3c.eth.chain_id,
+        "chainId": get_w3c().eth.chain_id,
         "from_address": tx_info.from_account,
         "to_address": to_address,
         "data": data_hex,
@@ -104,15 +151,84 @@ async def process_tx(tx_hash: str, intent: str) -> tuple[int, str]:
     logger.info(f"TX {tx_hash} ALLOWED, RELEASING.")
     return (RELEASED_TX, await release_tx(tx_hash))
 
-def get_intent_key(request: Request) -> str:
-    return str(f"{request.client.host}:{datetime.now().strftime('%Y%m%d%H%M')}")
+def get_intent_key(conn: HTTPConnection) -> str:
+    return str(f"{conn.client.host}:{datetime.now().strftime('%Y%m%d%H%M')}")
+
+def needs_validation(body: bytes, methods: tuple[bytes, ...]) -> bool:
+    # a byte scan is enough to rule out interception; false positives just take
+    # the validated path. \u escapes could spell a method name, so they do too.
+    return b"\\u" in body or any(method in body for method in methods)
+
+async def forward_raw(body: bytes) -> tuple[int, bytes]:
+    global provider_session
+    if provider_session is None:
+        provider_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=PROVIDER_TIMEOUT))
+    async with provider_session.post(PROVIDER_URL, data=body, headers={"Content-Type": "application/json"}) as resp:
+        return resp.status, await resp.read()
+
+def provider_error(body: bytes, message: str) -> dict | list:
+    # forwarded bodies are never parsed on success; on failure the ids are
+    # recovered so clients can still match the error to their requests
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    if isinstance(payload, list):
+        return [rpc_error(p.get("id") if isinstance(p, dict) else None, -32603, message) for p in payload]
+    return rpc_error(payload.get("id") if isinstance(payload, dict) else None, -32603, message)
+
+async def forward_http(body: bytes) -> Response:
+    try:
+        status, content = await forward_raw(body)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"ERROR DELEGATING REQUEST: {e!r}")
+        return JSONResponse(provider_error(body, "Error contacting provider."), status_code=502)
+    return Response(content=content, status_code=status, media_type="application/json")
+
+async def forward_ws(body: bytes) -> bytes | dict | list:
+    """
+    Forwards a websocket request to the provider. Returns the provider's bytes, or
+    a JSON-RPC error when it can't be reached or doesn't answer with JSON.
+    """
+    try:
+        status, content = await forward_raw(body)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"ERROR DELEGATING REQUEST: {e!r}")
+        return provider_error(body, "Error contacting provider.")
+    # checking the first byte keeps error pages off the socket without parsing
+    if status > 299 or content.lstrip()[:1] not in (b"{", b"["):
+        logger.error(f"UNEXPECTED PROVIDER RESPONSE: HTTP {status}")
+        return provider_error(body, f"Provider error: HTTP {status}.")
+    return content
+
+async def close_provider_session():
+    global provider_session
+    if provider_session is not None:
+        await provider_session.close()
+        provider_session = None
 
 @rpc_router.post("/")
-async def rpc_handler(rpc: RPC, request: Request) -> dict:
-    clean_intents()
+async def rpc_handler(request: Request):
+    body = await request.body()
+    if not needs_validation(body, HTTP_INTERCEPTED_METHODS):
+        logger.debug("DELEGATING REQUEST TO PROVIDER")
+        return await forward_http(body)
+
+    try:
+        rpc = RPC.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
     if rpc.method != "eth_sendRawTransaction":
         logger.debug(f"DELEGATING REQUEST TO PROVIDER: {rpc.method}")
-        return w3c.provider.make_request(rpc.method, rpc.params) # type: ignore
+        return await forward_http(body)
+    clean_intents()
+    return await intercept_raw_tx(rpc, request)
+
+async def intercept_raw_tx(rpc: RPC, conn: HTTPConnection) -> dict:
+    from eth_account import Account
+    from eth_account.typed_transactions.typed_transaction import TypedTransaction
+    from hexbytes import HexBytes
+
     logger.info(f"INTERCEPTING REQUEST: {rpc.method}")
 
     tx = TypedTransaction.from_bytes(
@@ -122,7 +238,7 @@ async def rpc_handler(rpc: RPC, request: Request) -> dict:
     from_account = Account.recover_transaction(rpc.params[0])
     tx["from"] = from_account
 
-    tx_hash = w3c.keccak(
+    tx_hash = get_w3c().keccak(
         HexBytes(rpc.params[0])
     ).to_0x_hex()
 
@@ -137,7 +253,7 @@ async def rpc_handler(rpc: RPC, request: Request) -> dict:
         from_account=from_account,
     )
 
-    intent = intents[get_intent_key(request)]
+    intent = intents[get_intent_key(conn)]
 
     try:
         t, s = await process_tx(tx_hash, intent)
@@ -156,6 +272,116 @@ async def rpc_handler(rpc: RPC, request: Request) -> dict:
         )
     raise
 
+def rpc_error(rpc_id: int | str | None, code: int, message: str) -> dict:
+    return {"error": {"code": code, "message": message}, "id": rpc_id, "jsonrpc": "2.0"}
+
+async def ws_dispatch(payload: dict, websocket: WebSocket, outbox: asyncio.Queue, client_subs: set[str]) -> dict:
+    try:
+        rpc = RPC.model_validate(payload)
+    except ValidationError:
+        return rpc_error(payload.get("id") if isinstance(payload, dict) else None, -32600, "Invalid request")
+
+    # a bad message only fails its own request, never the socket or its subscriptions
+    try:
+        return await ws_handle(rpc, payload, websocket, outbox, client_subs)
+    except (IndexError, TypeError, ValueError) as e:
+        logger.warning(f"INVALID PARAMS FOR {rpc.method}: {e}")
+        return rpc_error(rpc.id, -32602, "Invalid params.")
+    except Exception as e:
+        logger.error(f"ERROR HANDLING {rpc.method}: {e!r}")
+        return rpc_error(rpc.id, -32603, "Internal error.")
+
+async def ws_handle(rpc: RPC, payload: dict, websocket: WebSocket, outbox: asyncio.Queue, client_subs: set[str]) -> dict:
+    if rpc.method == "eth_subscribe":
+        try:
+            sub_id = await subscription_hub.subscribe(rpc.params, outbox)
+        except UpstreamError as e:
+            return {"error": e.error, "id": rpc.id, "jsonrpc": "2.0"}
+        client_subs.add(sub_id)
+        return {"result": sub_id, "id": rpc.id, "jsonrpc": "2.0"}
+
+    if rpc.method == "eth_unsubscribe":
+        sub_id = rpc.params[0] if rpc.params else None
+        removed = sub_id in client_subs and await subscription_hub.unsubscribe(sub_id)
+        client_subs.discard(sub_id)
+        return {"result": removed, "id": rpc.id, "jsonrpc": "2.0"}
+
+    if rpc.method == "eth_sendRawTransaction":
+        clean_intents()
+        try:
+            return await intercept_raw_tx(rpc, websocket)
+        except HTTPException as e:
+            return rpc_error(rpc.id, -32000, e.detail)
+        except KeyError:
+            return rpc_error(rpc.id, -32000, "No intent registered for this client.")
+
+    logger.debug(f"DELEGATING REQUEST TO PROVIDER: {rpc.method}")
+    content = await forward_ws(json.dumps(payload).encode())
+    if not isinstance(content, bytes):
+        return content
+    try:
+        return json.loads(content)
+    except ValueError:
+        return rpc_error(rpc.id, -32603, "Invalid provider response.")
+
+async def ws_sender(websocket: WebSocket, outbox: asyncio.Queue):
+    while True:
+        message = await outbox.get()
+        if isinstance(message, str):
+            await websocket.send_text(message)
+        else:
+            await websocket.send_json(message)
+
+async def ws_handle_message(message: str, websocket: WebSocket, outbox: asyncio.Queue, client_subs: set[str]):
+    if not needs_validation(message.encode(), WS_INTERCEPTED_METHODS):
+        logger.debug("DELEGATING REQUEST TO PROVIDER")
+        content = await forward_ws(message.encode())
+        await outbox.put(content.decode() if isinstance(content, bytes) else content)
+        return
+    try:
+        payload = json.loads(message)
+    except json.JSONDecodeError:
+        await outbox.put(rpc_error(None, -32700, "Parse error"))
+        return
+    if isinstance(payload, list):
+        await outbox.put([await ws_dispatch(p, websocket, outbox, client_subs) for p in payload])
+    else:
+        await outbox.put(await ws_dispatch(payload, websocket, outbox, client_subs))
+
+async def ws_receiver(websocket: WebSocket, outbox: asyncio.Queue, client_subs: set[str], in_flight: set[asyncio.Task]):
+    # every message gets its own task, so a slow intercepted transaction
+    # doesn't hold up the client's other requests
+    while True:
+        message = await websocket.receive_text()
+        task = asyncio.create_task(ws_handle_message(message, websocket, outbox, client_subs))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+@rpc_router.websocket("/")
+async def rpc_ws_handler(websocket: WebSocket):
+    await websocket.accept()
+    # responses and subscription notifications share one outbox so that
+    # a single task owns writes to the socket
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+    client_subs: set[str] = set()
+    in_flight: set[asyncio.Task] = set()
+    sender = asyncio.create_task(ws_sender(websocket, outbox))
+    receiver = asyncio.create_task(ws_receiver(websocket, outbox, client_subs, in_flight))
+    try:
+        # whichever side fails first (client gone, send error) ends the connection
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            e = task.exception()
+            if isinstance(e, WebSocketDisconnect):
+                logger.debug("Websocket client disconnected")
+            elif e is not None:
+                logger.warning(f"Closing websocket: {e!r}")
+    finally:
+        for task in (sender, receiver, *in_flight):
+            task.cancel()
+        for sub_id in list(client_subs):
+            await subscription_hub.unsubscribe(sub_id)
+
 @rpc_router.post("/intents")
 async def set_intent(intent_request: IntentRequest, request: Request):
     clean_intents()
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import secrets
+
+from dataclasses import dataclass, field
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_TIMEOUT = 10
+RECONNECT_DELAY = 1
+CLIENT_QUEUE_SIZE = 1024
+
+class UpstreamError(Exception):
+    def __init__(self, error: dict):
+        super().__init__(error.get("message", "Upstream error"))
+        self.error = error
+
+@dataclass
+class Topic:
+    key: str
+    params: list
+    upstream_id: str
+    listeners: dict[str, asyncio.Queue] = field(default_factory=dict)
+
+class SubscriptionHub:
+    """
+    Keeps a single websocket to the provider and shares one upstream
+    eth_subscribe per topic (newHeads, logs filter, ...) across all clients.
+    Notifications are fanned out to each client's outbox queue, rewritten
+    with the client-facing subscription id.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._session: aiohttp.ClientSession | None = None
+        self._ws: aiohttp.ClientWebSocketResponse | None = None
+        self._reader: asyncio.Task | None = None
+        self._resubscriber: asyncio.Task | None = None
+        self._connect_lock = asyncio.Lock()
+        self._topic_lock = asyncio.Lock()
+        self._closing = False
+        self._request_id = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self._topics: dict[str, Topic] = {}
+        self._by_upstream: dict[str, Topic] = {}
+        self._clients: dict[str, Topic] = {}
+
+    async def subscribe(self, params: list, outbox: asyncio.Queue) -> str:
+        key = json.dumps(params, sort_keys=True)
+        async with self._topic_lock:
+            topic = self._topics.get(key)
+            if topic is None:
+                upstream_id = await self._call("eth_subscribe", params)
+                topic = Topic(key=key, params=params, upstream_id=upstream_id)
+                self._topics[key] = topic
+                self._by_upstream[upstream_id] = topic
+                logger.info(f"Opened upstream subscription {upstream_id} for {key}")
+            client_id = f"0x{secrets.token_hex(16)}"
+            topic.listeners[client_id] = outbox
+            self._clients[client_id] = topic
+        return client_id
+
+    async def unsubscribe(self, client_id: str) -> bool:
+        async with self._topic_lock:
+            topic = self._clients.pop(client_id, None)
+            if topic is None:
+                return False
+            topic.listeners.pop(client_id, None)
+            if topic.listeners:
+                return True
+            self._topics.pop(topic.key, None)
+            self._by_upstream.pop(topic.upstream_id, None)
+            try:
+                await self._call("eth_unsubscribe", [topic.upstream_id])
+                logger.info(f"Closed upstream subscription {topic.upstream_id}")
+            except Exception as e:
+                logger.warning(f"Failed to close upstream subscription {topic.upstream_id}: {e}")
+        return True
+
+    async def close(self):
+        self._closing = True
+        if self._resubscriber is not None:
+            self._resubscriber.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    async def _connect(self) -> aiohttp.ClientWebSocketResponse:
+        async with self._connect_lock:
+            if self._ws is None or self._ws.closed:
+                if self._session is None:
+                    self._session = aiohttp.ClientSession()
+                # _call runs under _topic_lock, so an unresponsive upstream
+                # must not hold the handshake for aiohttp's default 300s
+                self._ws = await asyncio.wait_for(self._session.ws_connect(self.url, heartbeat=30), UPSTREAM_TIMEOUT)
+                self._reader = asyncio.create_task(self._read(self._ws))
+                logger.info("Connected to upstream websocket")
+            return self._ws
+
+    async def _call(self, method: str, params: list):
+        ws = await self._connect()
+        self._request_id += 1
+        request_id = self._request_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await ws.send_json({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params})
+            response = await asyncio.wait_for(future, UPSTREAM_TIMEOUT)
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in response:
+            raise UpstreamError(response["error"])
+        return response["result"]
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse):
+        try:
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.ERROR:
+                    break
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    self._dispatch(json.loads(msg.data))
+                except Exception as e:
+                    logger.warning(f"Ignoring malformed upstream message: {e!r}")
+        finally:
+            # nobody reads this socket any more, so make sure _connect opens a new one
+            await ws.close()
+            logger.warning("Upstream websocket closed")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Upstream websocket closed"))
+            if self._topics and not self._closing and (self._resubscriber is None or self._resubscriber.done()):
+                self._resubscriber = asyncio.create_task(self._resubscribe())
+
+    def _dispatch(self, message: dict):
+        if message.get("method") != "eth_subscription":
+            future = self._pending.get(message.get("id"))
+            if future is not None and not future.done():
+                future.set_result(message)
+            return
+
+        params = message["params"]
+        topic = self._by_upstream.get(params["subscription"])
+        if topic is None:
+            logger.debug(f"Notification for unknown subscription {params['subscription']}")
+            return
+        for client_id, outbox in topic.listeners.items():
+            try:
+                outbox.put_nowait({
+                    "jsonrpc": "2.0",
+                    "method": "eth_subscription",
+                    "params": {"subscription": client_id, "result": params["result"]},
+                })
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping notification for slow subscriber {client_id}")
+
+    async def _resubscribe(self):
+        while self._topics and not self._closing:
+            await asyncio.sleep(RECONNECT_DELAY)
+            async with self._topic_lock:
+                # new ids are only committed once every topic is back, so a
+                # failed round never leaves half-restored or duplicate topics
+                restored: dict[str, Topic] = {}
+                try:
+                    for topic in self._topics.values():
+                        restored[await self._call("eth_subscribe", topic.params)] = topic
+                except Exception as e:
+                    logger.warning(f"Failed to restore upstream subscriptions: {e}")
+                    for upstream_id in restored:
+                        try:
+                            await self._call("eth_unsubscribe", [upstream_id])
+                        except Exception:
+                            # the connection is gone, and its subscriptions with it
+                            break
+                    continue
+                for upstream_id, topic in restored.items():
+                    topic.upstream_id = upstream_id
+                self._by_upstream = restored
+            logger.info(f"Restored {len(restored)} upstream subscriptions")
+            return
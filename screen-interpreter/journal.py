@@ -0,0 +1,66 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """
+    Journal append-only en formato JSON lines (frames, análisis e intenciones finales).
+
+    Las entradas se encolan y las escribe un único hilo en segundo plano, que mantiene
+    el archivo abierto con buffer, así los hilos de las peticiones nunca esperan al disco.
+    El flush se hace en cuanto la cola queda vacía, o cada `flush_interval` segundos si
+    las entradas no dejan de llegar. Con `submit` se pueden encolar otras escrituras
+    (p.ej. guardar capturas) que se ejecutan en orden con las entradas.
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, kind, session_id, **fields):
+        """Encola una entrada del journal sin bloquear."""
+        self._queue.put({
+            'ts': datetime.now().isoformat(timespec='microseconds'),
+            'kind': kind,
+            'session_id': session_id,
+            **fields
+        })
+
+    def submit(self, fn, *args):
+        """Ejecuta fn(*args) en el hilo escritor, en orden con las entradas del journal."""
+        self._queue.put((fn, args))
+
+    def close(self):
+        """Vacía la cola pendiente y detiene el hilo escritor."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        with open(self.path, 'a', encoding='utf-8', buffering=64 * 1024) as f:
+            last_flush = time.monotonic()
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if isinstance(item, dict):
+                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                else:
+                    fn, args = item
+                    try:
+                        fn(*args)
+                    except Exception as e:
+                        logger.error(f"Error en escritura en segundo plano: {str(e)}")
+                if self._queue.empty() or time.monotonic() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.monotonic()
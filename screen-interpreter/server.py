@@ -1,35 +1,49 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import base64
+import importlib
 import os
 from datetime import datetime
 import logging
-from PIL import Image
+from logging.handlers import QueueHandler, QueueListener
 import io
-import numpy as np
 from io import BytesIO
-from openai import OpenAI
 from collections import deque
 import time
 import requests
 import shutil
+import signal
+import sys
 import json
+import threading
+import queue
+import uuid
+import atexit
 from dotenv import load_dotenv
+from journal import Journal
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
-# Configurar logging
+# Configurar logging: los handlers de archivo y consola corren en un hilo aparte
+# (QueueListener) para que las peticiones no esperen a la escritura del log
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, logging.FileHandler('server.log'), logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+# docker stop envía SIGTERM: salir con sys.exit para que atexit cierre el journal
+# y el listener del log en lugar de perder lo que tengan pendiente
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('server.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+# Journal de frames, análisis e intenciones finales
+journal = Journal(os.getenv('JOURNAL_PATH', 'journal.jsonl'))
+
 app = Flask(__name__)
 
 # Configurar CORS para permitir peticiones desde cualquier origen
@@ -47,7 +61,29 @@ if not api_key:
     logger.error("OPENAI_API_KEY no encontrada en variables de entorno")
     raise ValueError("OPENAI_API_KEY debe estar definida en el archivo .env")
 
-client = OpenAI(api_key=api_key)
+# openai, numpy y PIL son lentos de importar: el cliente y las librerías de imagen
+# se cargan en el primer uso (o en segundo plano con warm_up al arrancar)
+client = None
+client_lock = threading.Lock()
+
+def get_client():
+    """Devuelve el cliente de OpenAI, creándolo en el primer uso."""
+    global client
+    with client_lock:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=api_key)
+    return client
+
+def warm_up():
+    """Importa las librerías pesadas y crea el cliente sin bloquear el arranque."""
+    try:
+        importlib.import_module('numpy')
+        importlib.import_module('PIL.Image')
+        get_client()
+        logger.info("Warm-up completado")
+    except Exception as e:
+        logger.error(f"Error en warm-up: {str(e)}")
 
 # Asegurarse de que la carpeta images existe
 if not os.path.exists('images'):
@@ -56,26 +92,39 @@ if not os.path.exists('images'):
 # Variables globales
 last_image = None
 last_image_path = None
-image_buffer = deque(maxlen=5)  # Buffer para mantener las últimas 5 imágenes
+image_buffer = deque(maxlen=5)  # Buffer con las últimas 5 imágenes como (ruta, imagen)
 last_analysis_time = 0
 ANALYSIS_COOLDOWN = 30  # Segundos entre análisis
 all_analyses = []  # Lista para almacenar todos los análisis
 is_processing = False  # Flag para controlar si estamos procesando imágenes
-
-def save_analysis_to_file(analysis_text):
-    """Guarda el análisis en un archivo."""
-    try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'analysis_{timestamp}.txt'
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(analysis_text)
-        logger.info(f"Análisis guardado en {filename}")
-        return filename
-    except Exception as e:
-        logger.error(f"Error al guardar análisis: {str(e)}")
-        return None
+session_id = None  # Id de la grabación actual, se asigna con la primera imagen
+
+def current_session():
+    """Devuelve el id de la grabación actual, creando uno si no existe."""
+    global session_id
+    if session_id is None:
+        session_id = uuid.uuid4().hex
+        logger.info(f"Nueva sesión de grabación: {session_id}")
+    return session_id
+
+def end_session():
+    """Cierra la grabación actual; la próxima imagen abre una sesión nueva."""
+    global session_id
+    session_id = None
+
+def save_analysis(analysis_text, image_path):
+    """Registra el análisis de una imagen en el journal."""
+    journal.record('analysis', current_session(), image=image_path, analysis=analysis_text)
+    logger.info(f"Análisis de {image_path} registrado en el journal")
 
 def clean_images_directory():
+    """
+    Programa la limpieza del directorio de imágenes en el hilo escritor del journal.
+    No espera al resultado: los errores de remove_images_directory solo quedan en el log.
+    """
+    journal.submit(remove_images_directory)
+
+def remove_images_directory():
     """Limpia el directorio de imágenes."""
     try:
         if os.path.exists('images'):
@@ -89,15 +138,20 @@ def clean_images_directory():
 
 @app.route('/clean-images', methods=['POST'])
 def clean_images():
-    """Endpoint para limpiar las imágenes."""
-    success = clean_images_directory()
+    """
+    Endpoint para limpiar las imágenes. Solo programa la limpieza (se hace en segundo
+    plano, en orden con las capturas pendientes), así que no informa si falló.
+    """
+    clean_images_directory()
     return jsonify({
-        'success': success,
-        'message': 'Directorio de imágenes limpiado' if success else 'Error al limpiar directorio'
+        'scheduled': True,
+        'message': 'Limpieza del directorio de imágenes programada'
     })
 
 def calculate_image_difference(img1, img2):
     """Calcula la diferencia porcentual entre dos imágenes."""
+    import numpy as np
+
     # Convertir imágenes a arrays numpy
     arr1 = np.array(img1)
     arr2 = np.array(img2)
@@ -122,10 +176,12 @@ def encode_image(image_path):
         return None
 
 
-def encode_image_downscaled(image_path, max_width=1280, max_height=720, output_format='JPEG', quality=85):
-    """Abre una imagen, la reduce manteniendo aspecto a un bounding box 1280x720 y la devuelve en base64."""
+def encode_image_downscaled(image, max_width=1280, max_height=720, output_format='JPEG', quality=85):
+    """Abre una imagen (ruta o imagen PIL), la reduce manteniendo aspecto a un bounding box 1280x720 y la devuelve en base64."""
+    from PIL import Image
+
     try:
-        img = Image.open(image_path)
+        img = Image.open(image) if isinstance(image, str) else image.copy()
         # Asegurar espacio de color compatible
         if img.mode not in ("RGB", "L"):  # p.ej. RGBA
             img = img.convert("RGB")
@@ -171,7 +227,7 @@ def analyze_final_intent(previous_analyses):
         """
 
         # Llamar a la API de ChatGPT
-        response = client.responses.create(
+        response = get_client().responses.create(
             model="gpt-5",
             input=[
                 {
@@ -183,16 +239,14 @@ def analyze_final_intent(previous_analyses):
             ]
         )
 
-        # Guardar el análisis final en un archivo
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'final_analysis_{timestamp}.txt'
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(response.output_text)
-        logger.info(f"Análisis final guardado en {filename}")
+        # Registrar el análisis final en el journal
+        sid = current_session()
+        journal.record('final_intent', sid, analysis=response.output_text)
+        logger.info(f"Análisis final de la sesión {sid} registrado en el journal")
 
         return {
             'analysis': response.output_text,
-            'file': filename
+            'session_id': sid
         }
 
     except Exception as e:
@@ -215,6 +269,7 @@ def generate_final_analysis():
         if final_analysis:
             # Limpiar la lista de análisis después de generar el final
             all_analyses = []
+            end_session()
             return jsonify({
                 'success': True,
                 'message': 'Análisis final generado correctamente',
@@ -279,7 +334,7 @@ def check_metamask_opened(image_path):
         """
         
         # Call ChatGPT API
-        response = client.responses.create(
+        response = get_client().responses.create(
             model="gpt-5",
             input=[
                 {
@@ -328,7 +383,7 @@ def stop_recording():
         return '', 200
 
     logger.info("Recibida petición para detener la grabación")
-    logger.info(f"Estado inicial del buffer: {list(image_buffer)}")
+    logger.info(f"Estado inicial del buffer: {[path for path, _ in image_buffer]}")
     logger.info(f"Número de imágenes en el buffer: {len(image_buffer)}")
     
     try:
@@ -338,75 +393,70 @@ def stop_recording():
         
         # Convertir el buffer a una lista y limpiarlo inmediatamente
         images_to_process = list(image_buffer)
-        logger.info(f"Imágenes a procesar: {images_to_process}")
+        logger.info(f"Imágenes a procesar: {[path for path, _ in images_to_process]}")
         image_buffer.clear()
         logger.info("Buffer limpiado")
         
         logger.info(f"Procesando {len(images_to_process)} imágenes pendientes...")
         
         processed_images = []
-        for image_path in images_to_process:
-            if os.path.exists(image_path):
-                logger.info(f"Analizando imagen: {image_path}")
-                processed_images.append(image_path)
-                # Downscale a 720p y codificar
-                base64_image = encode_image_downscaled(image_path)
-                if base64_image:
-                    # Crear el prompt para ChatGPT
-                    prompt = """
-                    You are analyzing a screenshot for a cryptocurrency transaction detection app. Your goal is to understand what the user is looking at and whether it relates to cryptocurrency investment or trading intentions.
-
-                    Describe what you see in a natural, conversational way. For example:
-                    - "The user is browsing Twitter and reading a post about the benefits of a specific cryptocurrency"
-                    - "The user is searching Google for information about a particular crypto"
-                    - "The user is reading an article about top 10 cryptocurrencies and currently viewing the CARDANO section"
-                    - "The user is on a DEX platform trying to swap ETH for another token"
-                    - "The user is reading a news article about Bitcoin price movements"
-                    - "The user is on a wallet interface with the intention to transfer 0.5 ETH to wallet address 0x742d35Cc6634C0532925a3b8D4C9db96C4b4d8b6"
-
-                    Focus on:
-                    - What platform or website the user is on
-                    - What content they are consuming or interacting with
-                    - Any cryptocurrency names, prices, or trading information visible
-                    - Whether this suggests investment research, trading intent, or general crypto interest
-                    - Any suspicious or risky elements that might indicate scam attempts
-
-                    It's very useful to capture any data regarding what the user might be trying to do. Specifically look for:
-                    - Buy cryptocurrency (specify which one)
-                    - Sell cryptocurrency (specify which one)
-                    - Exchange/swap tokens (specify which ones)
-                    - Transfer funds to another wallet
-                    - Involved wallet addresses
-                    - Research before making a transaction
-
-                    Its really important to capture the addresses, if you see any, you should capture and report them.
-                    Addresses can be ofuscated like 0xAdc8b143f...9BF75A4139 treat them with importance but say its an ofuscated address, like this ofuscatedAddress(0xAd8b143f...9BF75A4139)
-
-                    Write your response as if you're explaining to a colleague what the user is doing right now. Be natural and descriptive, not overly structured.
-                    """
-
-                    # Llamar a la API de ChatGPT con el formato correcto
-                    response = client.responses.create(
-                        model="gpt-5",
-                        input=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "input_text", "text": prompt},
-                                    {"type": "input_image", "image_url": f"data:image/jpeg;base64,{base64_image}"}
-                                ]
-                            }
-                        ]
-                    )
-
-                    # Guardar el análisis
-                    analysis_text = response.output_text
-                    analysis_file = save_analysis_to_file(analysis_text)
-                    if analysis_file:
-                        logger.info(f"Análisis guardado en {analysis_file}")
-                        all_analyses.append(analysis_text)
-            else:
-                logger.warning(f"Imagen no encontrada: {image_path}")
+        for image_path, image in images_to_process:
+            logger.info(f"Analizando imagen: {image_path}")
+            processed_images.append(image_path)
+            # Downscale a 720p y codificar
+            base64_image = encode_image_downscaled(image)
+            if base64_image:
+                # Crear el prompt para ChatGPT
+                prompt = """
+                You are analyzing a screenshot for a cryptocurrency transaction detection app. Your goal is to understand what the user is looking at and whether it relates to cryptocurrency investment or trading intentions.
+
+                Describe what you see in a natural, conversational way. For example:
+                - "The user is browsing Twitter and reading a post about the benefits of a specific cryptocurrency"
+                - "The user is searching Google for information about a particular crypto"
+                - "The user is reading an article about top 10 cryptocurrencies and currently viewing the CARDANO section"
+                - "The user is on a DEX platform trying to swap ETH for another token"
+                - "The user is reading a news article about Bitcoin price movements"
+                - "The user is on a wallet interface with the intention to transfer 0.5 ETH to wallet address 0x742d35Cc6634C0532925a3b8D4C9db96C4b4d8b6"
+
+                Focus on:
+                - What platform or website the user is on
+                - What content they are consuming or interacting with
+                - Any cryptocurrency names, prices, or trading information visible
+                - Whether this suggests investment research, trading intent, or general crypto interest
+                - Any suspicious or risky elements that might indicate scam attempts
+
+                It's very useful to capture any data regarding what the user might be trying to do. Specifically look for:
+                - Buy cryptocurrency (specify which one)
+                - Sell cryptocurrency (specify which one)
+                - Exchange/swap tokens (specify which ones)
+                - Transfer funds to another wallet
+                - Involved wallet addresses
+                - Research before making a transaction
+
+                Its really important to capture the addresses, if you see any, you should capture and report them.
+                Addresses can be ofuscated like 0xAdc8b143f...9BF75A4139 treat them with importance but say its an ofuscated address, like this ofuscatedAddress(0xAd8b143f...9BF75A4139)
+
+                Write your response as if you're explaining to a colleague what the user is doing right now. Be natural and descriptive, not overly structured.
+                """
+
+                # Llamar a la API de ChatGPT con el formato correcto
+                response = get_client().responses.create(
+                    model="gpt-5",
+                    input=[
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "input_text", "text": prompt},
+                                {"type": "input_image", "image_url": f"data:image/jpeg;base64,{base64_image}"}
+                            ]
+                        }
+                    ]
+                )
+
+                # Guardar el análisis
+                analysis_text = response.output_text
+                save_analysis(analysis_text, image_path)
+                all_analyses.append(analysis_text)
         
         logger.info(f"Imágenes procesadas: {processed_images}")
         logger.info(f"Número de análisis generados: {len(all_analyses)}")
@@ -429,6 +479,7 @@ def stop_recording():
             # Limpiar las imágenes y los análisis
             clean_images_directory()
             all_analyses.clear()
+            end_session()
             
             logger.info("Imágenes y análisis limpiados correctamente")
             
@@ -461,6 +512,7 @@ def stop_recording():
 @app.route('/save-image', methods=['POST', 'OPTIONS'])
 def save_image():
     global last_image, last_image_path, is_processing
+    from PIL import Image
     
     # Manejar preflight request
     if request.method == 'OPTIONS':
@@ -499,6 +551,7 @@ def save_image():
         try:
             image_bytes = base64.b64decode(image_data)
             current_image = Image.open(BytesIO(image_bytes))
+            current_image.load()
             logger.info("Imagen decodificada correctamente")
         except Exception as e:
             logger.error(f"Error al decodificar base64: {str(e)}")
@@ -513,19 +566,20 @@ def save_image():
             should_save = difference > 20  # Guardar solo si hay más de 20% de diferencia
         
         if should_save:
-            # Crear nombre de archivo con timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            # Crear nombre de archivo con timestamp (con microsegundos para no pisar capturas)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
             filename = f'images/captura_{timestamp}.png'
             
-            # Guardar la imagen
+            # Guardar la imagen en segundo plano; el análisis usa la copia en memoria
             try:
-                current_image.save(filename, 'PNG')
-                logger.info(f"Imagen guardada en {filename}")
+                journal.submit(current_image.save, filename, 'PNG')
+                journal.record('frame', current_session(), image=filename, difference=float(difference))
+                logger.info(f"Imagen encolada para guardar en {filename}")
                 
                 # Actualizar la última imagen y el buffer
                 last_image = current_image
                 last_image_path = filename
-                image_buffer.append(filename)
+                image_buffer.append((filename, current_image))
                 
                 return jsonify({
                     'success': True, 
@@ -548,6 +602,10 @@ def save_image():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
+    debug = True
+    # con el reloader activo solo el proceso hijo atiende peticiones
+    if os.getenv('WARMUP', 'true').lower() == 'true' and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        threading.Thread(target=warm_up, daemon=True).start()
     logger.info("Iniciando servidor en puerto 5001...")
-    app.run(host='0.0.0.0', port=5001, debug=True) 
+    app.run(host='0.0.0.0', port=5001, debug=debug) 
     
\ No newline at end of file